@@ -3,3 +3,5 @@ from .instruction import Instruction, Ilist
 from .renderable import ImageRenderable, TextRenderable, Box
 from .axis import Flex, Axis
 from .transform import AspectRatio, Padding
+from .displaylist import BlobStore
+from .budget import Budget
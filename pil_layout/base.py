@@ -1,4 +1,4 @@
-import abc, inspect
+import abc, sys
 from .units import Dim
 
 NO_SOURCES = False # so asserts don't have to find the layout object in test suite
@@ -13,14 +13,20 @@ class Layout(abc.ABC):
     def stack():
         "parse the stack to create a 'stack trace' of our depth in the layout tree"
         classes = []
-        for frame in inspect.stack():
-            if frame.frame.f_code.co_name == 'compute':
-                _, _, _, value_dict = inspect.getargvalues(frame.frame)
-                if (frame_self := value_dict.get('self')):
-                    if issubclass(frame_self.__class__, Layout):
-                        classes.append(frame_self.__class__.__name__)
+        # note: walking f_back is much cheaper than inspect.stack(), and only compute frames get their locals read
+        frame = sys._getframe(1) # pylint: disable=protected-access
+        while frame is not None:
+            if frame.f_code.co_name == 'compute':
+                if isinstance(frame.f_locals.get('self'), Layout):
+                    classes.append(frame.f_locals['self'].__class__.__name__)
+            frame = frame.f_back
         return list(reversed(classes))
 
+    def digest(self) -> bytes:
+        "stable hash of this subtree: parameters, child digests and image content. output cache key"
+        from .digest import digest_fields # pylint: disable=import-outside-toplevel,cyclic-import
+        return digest_fields(self)
+
     @abc.abstractmethod
     def compute(self, dim: Dim, dpi: int) -> 'Ilist':
         ...
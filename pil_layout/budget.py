@@ -0,0 +1,77 @@
+"per-render memory accounting, so a bad spec can't allocate gigabytes"
+
+import contextvars, logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from .base import Layout
+from .common import LayoutError
+
+logger = logging.getLogger(__name__)
+
+CURRENT: contextvars.ContextVar[Optional['Budget']] = contextvars.ContextVar('pil_layout_budget', default=None)
+
+def bytes_per_pixel(mode: str) -> int:
+    "PIL's in-memory pixel size; 3-band modes are stored as 4 bytes"
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+@dataclass
+class Budget:
+    """Tracks image allocations inside a `with Budget(...)` block and enforces max_bytes.
+    When allow_downsample is set, allocations that can be downsampled (ImageRenderable) shrink to fit instead of raising.
+    per_node fills by_node; it walks the stack on every allocation, so it's off by default.
+    """
+    max_bytes: Optional[int] = None
+    allow_downsample: bool = False
+    per_node: bool = False
+    live_bytes: int = 0
+    peak_bytes: int = 0
+    total_pixels: int = 0
+    by_node: Dict[str, int] = field(default_factory=lambda: defaultdict(int)) # bytes allocated per node path, when per_node is set
+    token: Optional[contextvars.Token] = field(default=None, repr=False, compare=False)
+
+    def __enter__(self):
+        self.token = CURRENT.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        CURRENT.reset(self.token)
+        logger.debug('budget peak %d bytes, %d pixels', self.peak_bytes, self.total_pixels)
+
+    def charge(self, size: Tuple[int, int], mode: str, can_downsample: bool = False) -> Tuple[int, int]:
+        "account for an allocation, return the size to actually allocate. raises LayoutError if over budget"
+        width, height = size
+        nbytes = width * height * bytes_per_pixel(mode)
+        if self.max_bytes is not None and self.live_bytes + nbytes > self.max_bytes:
+            path = Layout.stack()
+            available = self.max_bytes - self.live_bytes
+            if not (can_downsample and self.allow_downsample and available > 0):
+                raise LayoutError(f"allocating {nbytes} bytes for {size} {mode} exceeds budget, {available} left", path=path)
+            ratio = (available / nbytes) ** 0.5
+            width, height = max(int(width * ratio), 1), max(int(height * ratio), 1)
+            logger.warning('downsampling %s to %s at %s', size, (width, height), '/'.join(path))
+            nbytes = width * height * bytes_per_pixel(mode)
+        self.live_bytes += nbytes
+        self.peak_bytes = max(self.peak_bytes, self.live_bytes)
+        self.total_pixels += width * height
+        if self.per_node:
+            self.by_node['/'.join(Layout.stack())] += nbytes
+        return width, height
+
+    def release(self, size: Tuple[int, int], mode: str):
+        "account for a scratch image that has been discarded"
+        self.live_bytes -= size[0] * size[1] * bytes_per_pixel(mode)
+
+def charge(size: Tuple[int, int], mode: str, can_downsample: bool = False) -> Tuple[int, int]:
+    "charge the current budget if there is one. returns size unchanged when no budget is active"
+    if (budget := CURRENT.get()) is None:
+        return size
+    return budget.charge(size, mode, can_downsample)
+
+def release(size: Tuple[int, int], mode: str):
+    if (budget := CURRENT.get()) is not None:
+        budget.release(size, mode)
@@ -0,0 +1,125 @@
+"final-output cache, keyed by Layout.digest() + render params. a hit skips compute and render entirely"
+
+import abc, hashlib, io, logging, os, threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image
+from .base import Layout
+from .units import Dim
+from .instruction import Ilist
+from .digest import digest_value
+from .displaylist import TMP_PREFIX, write_atomic
+from . import budget
+
+logger = logging.getLogger(__name__)
+
+class OutputCache(abc.ABC):
+    "backend interface. keys are sha256 digests, values are encoded images"
+
+    @abc.abstractmethod
+    def get(self, key: bytes) -> Optional[bytes]:
+        ...
+
+    @abc.abstractmethod
+    def put(self, key: bytes, data: bytes):
+        ...
+
+class MemoryCache(OutputCache):
+    "in-process LRU bounded by total bytes"
+
+    def __init__(self, max_bytes: int = 256 << 20):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.entries: 'OrderedDict[bytes, bytes]' = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        with self.lock:
+            if (data := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key: bytes, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if (old := self.entries.pop(key, None)) is not None:
+                self.total -= len(old)
+            self.entries[key] = data
+            self.total += len(data)
+            while self.total > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total -= len(evicted)
+
+class DirectoryCache(OutputCache):
+    """one file per key in a directory, which can be shared between processes.
+    when the directory passes max_bytes, least recently used files (by mtime, which get() touches) are deleted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 1 << 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.total = sum(entry.stat().st_size for entry in self.entries())
+
+    def entries(self):
+        "cache files, not counting temp files that another process is still writing"
+        return [entry for entry in os.scandir(self.path) if entry.is_file() and not entry.name.startswith(TMP_PREFIX)]
+
+    def get(self, key: bytes) -> Optional[bytes]:
+        path = os.path.join(self.path, key.hex())
+        try:
+            with open(path, 'rb') as fh:
+                data = fh.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: bytes, data: bytes):
+        write_atomic(os.path.join(self.path, key.hex()), data)
+        self.total += len(data)
+        if self.total > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        "delete oldest files until under 3/4 of max_bytes, so eviction doesn't run on every put"
+        entries = sorted(
+            (entry.stat().st_mtime_ns, entry.stat().st_size, entry.path)
+            for entry in self.entries()
+        )
+        self.total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self.total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass # another process evicted it
+            self.total -= size
+        logger.debug('evicted %s down to %d bytes', self.path, self.total)
+
+def cache_key(layout: Layout, dim: Dim, dpi: int, format: str, mode: str = 'RGBA', background=None) -> bytes: # pylint: disable=redefined-builtin
+    return hashlib.sha256(layout.digest() + digest_value([dim, dpi, format, mode, background])).digest()
+
+def canvas_size(ilist: Ilist, dim: Dim, dpi: int) -> Tuple[int, int]:
+    "pixel size of dim. an open axis (None) is sized to the content"
+    if dim.width is None or dim.height is None:
+        return Dim(dim.width or ilist.width(), dim.height or ilist.height()).to_px(dpi).tuple()
+    return dim.to_px(dpi).tuple()
+
+def encode(ilist: Ilist, dim: Dim, dpi: int, format: str, mode: str = 'RGBA', background=None, prepared: Optional[Dict[int, tuple]] = None) -> bytes: # pylint: disable=redefined-builtin
+    "render ilist onto a new canvas and encode it. prepared is passed through to Ilist.render"
+    im = Image.new(mode, budget.charge(canvas_size(ilist, dim, dpi), mode), background)
+    ilist.render(im, dpi, prepared)
+    buf = io.BytesIO()
+    im.save(buf, format)
+    return buf.getvalue()
+
+def render_cached(layout: Layout, dim: Dim, dpi: int, format: str, cache: OutputCache, mode: str = 'RGBA', background=None) -> bytes: # pylint: disable=redefined-builtin
+    "encoded image for layout, from cache if this tree has been rendered with these params before"
+    key = cache_key(layout, dim, dpi, format, mode, background)
+    if (data := cache.get(key)) is None:
+        data = encode(layout.compute(dim, dpi), dim, dpi, format, mode, background)
+        cache.put(key, data)
+    return data
@@ -1,8 +1,11 @@
-from typing import Tuple
+from typing import List, Optional, Tuple
 
 class LayoutError(Exception):
-    # todo: add tree position to these
-    pass
+    "path is the tree position, from Layout.stack(), when the raiser knows it"
+
+    def __init__(self, message: str, path: Optional[List[str]] = None):
+        super().__init__(message if path is None else f"{message} (at {'/'.join(path)})")
+        self.path = path
 
 def partition(seq, predicate) -> Tuple[list, list]:
     "turn seq into two seqs, (predicate_true, predict_false). ugh use a collections library"
@@ -0,0 +1,70 @@
+"stable structural hashes of layout trees, for caching rendered output"
+
+import dataclasses, functools, hashlib, os, weakref
+from typing import Dict, Tuple
+from PIL import Image
+from .base import Layout
+from .displaylist import image_digest
+from .renderable import load_font
+
+# id(image) -> (weakref, digest). images are assumed not to be mutated in place once they're in a layout
+IMAGE_DIGESTS: Dict[int, Tuple[weakref.ref, bytes]] = {}
+
+def image_digest_cached(image: Image.Image) -> bytes:
+    "image_digest() memoized for the life of the image object"
+    key = id(image)
+    if (hit := IMAGE_DIGESTS.get(key)) and hit[0]() is image:
+        return hit[1]
+    digest = image_digest(image)
+    IMAGE_DIGESTS[key] = (weakref.ref(image, lambda _: IMAGE_DIGESTS.pop(key, None)), digest)
+    return digest
+
+@functools.lru_cache(maxsize=64)
+def file_digest_version(path: str, mtime_ns: int, size: int) -> bytes: # pylint: disable=unused-argument
+    "mtime and size are in the cache key so an edited file gets rehashed"
+    with open(path, 'rb') as fh:
+        return hashlib.sha256(fh.read()).digest()
+
+def file_digest(path: str) -> bytes:
+    "content hash of a file, e.g. a font, so editing it in place changes the hash"
+    stat = os.stat(path)
+    return file_digest_version(path, stat.st_mtime_ns, stat.st_size)
+
+def font_digest(font: str) -> bytes:
+    "identity of a TextRenderable font, which truetype() accepts as a path or as a name to look up in the system font dirs"
+    if os.path.isfile(font):
+        return file_digest(font)
+    # PIL doesn't expose the path it resolved a name to, so use the name + the family and style it loaded
+    try:
+        family, style = load_font(font, 1).getname()
+    except OSError:
+        family, style = None, None # compute() will fail too, but hashing shouldn't be what raises
+    return hashlib.sha256(f'font:{font}:{family}:{style}'.encode()).digest()
+
+def digest_fields(obj) -> bytes:
+    "hash a dataclass by class name + fields. fields with compare=False are caches, not parameters"
+    hasher = hashlib.sha256(obj.__class__.__name__.encode())
+    for field in dataclasses.fields(obj):
+        if field.compare:
+            hasher.update(field.name.encode() + b'=' + digest_value(getattr(obj, field.name)))
+    return hasher.digest()
+
+def digest_value(value) -> bytes:
+    "hash a field value. Layouts recurse into Layout.digest(), which is what makes this a merkle tree"
+    if isinstance(value, Layout):
+        return value.digest()
+    if isinstance(value, Image.Image):
+        return b'image:' + image_digest_cached(value)
+    if dataclasses.is_dataclass(value):
+        return digest_fields(value)
+    hasher = hashlib.sha256()
+    if isinstance(value, (list, tuple)):
+        hasher.update(b'seq:%d' % len(value))
+        for item in value:
+            hasher.update(digest_value(item))
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        # type name so 1, 1.0, True and '1' differ
+        hasher.update(f'{type(value).__name__}:{value!r}'.encode())
+    else:
+        raise TypeError(f"can't digest {type(value).__name__}")
+    return hasher.digest()
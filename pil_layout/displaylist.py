@@ -0,0 +1,166 @@
+"compact on-disk format for computed Ilists. geometry goes in a packed array, images go in a content-addressed blob store"
+# format of a display list file (all little-endian):
+#   header: magic, version, n_instructions, n_images
+#   n_instructions * INSTRUCTION records: top, left, bottom, right as doubles, their 4 unit codes, image index
+#   n_images * 32-byte sha256 digests, which are keys into the BlobStore
+# blob files are BLOB_HEADER (mode, width, height) + raw pixel bytes, so they can be mapped without decoding. palette images are stored as RGB(A)
+
+import hashlib, mmap, os, struct, tempfile
+from collections import OrderedDict
+from typing import Dict, List
+from PIL import Image
+from .common import LayoutError
+from .units import Unit
+from .instruction import Instruction, Ilist
+
+MAGIC = b'PLDL'
+VERSION = 1
+HEADER = struct.Struct('<4sHII')
+INSTRUCTION = struct.Struct('<4d4Bi')
+DIGEST_SIZE = 32
+BLOB_HEADER = struct.Struct('<8sII')
+
+UNIT_CODES = {None: 0, 'in': 1, 'px': 2}
+UNIT_NAMES = {code: name for name, code in UNIT_CODES.items()}
+NO_IMAGE = -1
+NULL_INSTRUCTION = -2 # Ilist members are nullable
+
+def image_digest(image: Image.Image) -> bytes:
+    "sha256 of everything that affects how the image draws: mode, size, palette, transparency and pixel data"
+    hasher = hashlib.sha256(blob_header(image))
+    if image.mode in ('P', 'PA'):
+        hasher.update(bytes(image.getpalette() or []))
+    if (transparency := image.info.get('transparency')) is not None:
+        hasher.update(b'transparency:' + repr(transparency).encode())
+    hasher.update(image.tobytes())
+    return hasher.digest()
+
+def blob_header(image: Image.Image) -> bytes:
+    return BLOB_HEADER.pack(image.mode.encode(), image.width, image.height)
+
+TMP_PREFIX = '.tmp-' # so directory scans (DirectoryCache eviction) can skip other processes' in-flight writes
+
+def write_atomic(path: str, data: bytes):
+    "write to a temp file and rename, so concurrent readers never see a partial file"
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix=TMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass # don't hide the original error
+        raise
+
+def map_file(path: str) -> mmap.mmap:
+    with open(path, 'rb') as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+class BlobStore:
+    """directory of raw images keyed by content hash. loaded images share the page cache between processes.
+    each mapped blob holds a file descriptor, so at most max_loaded images are kept in memory here.
+    """
+
+    def __init__(self, path: str, max_loaded: int = 256):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.max_loaded = max_loaded
+        self.loaded: 'OrderedDict[bytes, Image.Image]' = OrderedDict()
+
+    def remember(self, digest: bytes, image: Image.Image):
+        "LRU insert into self.loaded"
+        self.loaded[digest] = image
+        self.loaded.move_to_end(digest)
+        while len(self.loaded) > self.max_loaded:
+            self.loaded.popitem(last=False)
+
+    def blob_path(self, digest: bytes) -> str:
+        return os.path.join(self.path, digest.hex())
+
+    def put(self, image: Image.Image) -> bytes:
+        "store image if it isn't already present, return its digest"
+        if image.mode in ('P', 'PA'):
+            # raw blobs have no room for a palette, so store the colors instead of the indexes
+            image = image.convert('RGBA' if image.mode == 'PA' or 'transparency' in image.info else 'RGB')
+        data = blob_header(image) + image.tobytes()
+        digest = hashlib.sha256(data).digest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        if digest not in self.loaded:
+            self.remember(digest, image)
+        return digest
+
+    def get(self, digest: bytes) -> Image.Image:
+        "return image for digest. images are read-only views of the mapped file where PIL supports it"
+        if (image := self.loaded.get(digest)) is None:
+            path = self.blob_path(digest)
+            if not os.path.exists(path):
+                raise LayoutError(f"missing blob {digest.hex()} in {self.path}")
+            buf = map_file(path)
+            raw_mode, width, height = BLOB_HEADER.unpack_from(buf)
+            mode = raw_mode.rstrip(b'\0').decode()
+            image = Image.frombuffer(mode, (width, height), memoryview(buf)[BLOB_HEADER.size:], 'raw', mode, 0, 1)
+        self.remember(digest, image)
+        return image
+
+def pack_unit(unit: Unit):
+    return unit.n, UNIT_CODES[unit.unit]
+
+def dumps(ilist: Ilist, store: BlobStore) -> bytes:
+    "serialize ilist. images are written to store"
+    digests: List[bytes] = []
+    indexes: Dict[bytes, int] = {}
+    records = bytearray(INSTRUCTION.size * len(ilist))
+    for i, inst in enumerate(ilist):
+        if inst is None:
+            INSTRUCTION.pack_into(records, i * INSTRUCTION.size, 0, 0, 0, 0, 0, 0, 0, 0, NULL_INSTRUCTION)
+            continue
+        image_index = NO_IMAGE
+        if inst.image:
+            digest = store.put(inst.image)
+            if (image_index := indexes.get(digest)) is None:
+                image_index = indexes[digest] = len(digests)
+                digests.append(digest)
+        (top, top_u), (left, left_u), (bottom, bottom_u), (right, right_u) = map(pack_unit, (inst.top, inst.left, inst.bottom, inst.right))
+        INSTRUCTION.pack_into(records, i * INSTRUCTION.size, top, left, bottom, right, top_u, left_u, bottom_u, right_u, image_index)
+    return HEADER.pack(MAGIC, VERSION, len(ilist), len(digests)) + bytes(records) + b''.join(digests)
+
+def loads(buf, store: BlobStore) -> Ilist:
+    "deserialize from any buffer (bytes, mmap). Instruction.source is not preserved"
+    if len(buf) < HEADER.size:
+        raise LayoutError("truncated display list")
+    magic, version, n_instructions, n_images = HEADER.unpack_from(buf)
+    if magic != MAGIC or version != VERSION:
+        raise LayoutError(f"not a version {VERSION} display list")
+    digest_offset = HEADER.size + n_instructions * INSTRUCTION.size
+    if len(buf) != digest_offset + n_images * DIGEST_SIZE:
+        raise LayoutError(f"corrupt display list: {len(buf)} bytes for {n_instructions} instructions and {n_images} images")
+    images = [
+        store.get(bytes(buf[digest_offset + i * DIGEST_SIZE:digest_offset + (i + 1) * DIGEST_SIZE]))
+        for i in range(n_images)
+    ]
+    ret = Ilist()
+    for top, left, bottom, right, top_u, left_u, bottom_u, right_u, image_index in INSTRUCTION.iter_unpack(buf[HEADER.size:digest_offset]):
+        if image_index == NULL_INSTRUCTION:
+            ret.append(None)
+            continue
+        ret.append(Instruction(
+            top=Unit(top, UNIT_NAMES[top_u]),
+            left=Unit(left, UNIT_NAMES[left_u]),
+            bottom=Unit(bottom, UNIT_NAMES[bottom_u]),
+            right=Unit(right, UNIT_NAMES[right_u]),
+            image=None if image_index == NO_IMAGE else images[image_index],
+        ))
+    return ret
+
+def dump(ilist: Ilist, path: str, store: BlobStore):
+    "write ilist to path, atomically"
+    write_atomic(path, dumps(ilist, store))
+
+def load(path: str, store: BlobStore) -> Ilist:
+    "map path and deserialize"
+    with map_file(path) as buf:
+        return loads(buf, store)
@@ -1,9 +1,10 @@
 import logging, dataclasses
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from PIL import Image, ImageDraw, ImageFont
 from .base import Layout
 from .units import Dim, Unit, Direction, is_horz
+from . import budget
 
 logger = logging.getLogger(__name__)
 
@@ -57,7 +58,11 @@ class Instruction:
     def shrink(self, ratio: float, dpi: int):
         "return a copy shrunk by ratio"
         dim = self.size() * ratio
-        image = self.image and self.image.resize(dim.to_px(dpi).tuple())
+        image = None
+        if self.image:
+            # the shrunk copy replaces this one in the layout, so the swap shouldn't count both
+            budget.release(self.image.size, self.image.mode)
+            image = self.image.resize(budget.charge(dim.to_px(dpi).tuple(), self.image.mode))
         return dataclasses.replace(self, right=self.left + dim.width, bottom=self.top + dim.height, image=image)
 
     def box(self, dpi: int) -> Tuple[int, int, int, int]:
@@ -85,11 +90,15 @@ class Ilist(list):
             ret.extend(ilist)
         return ret
 
-    def render(self, im: Image.Image, dpi: int):
-        "render instructions onto image. get instruction list from .compute() method on your outermost Layout object"
+    def render(self, im: Image.Image, dpi: int, cache: Optional[Dict[int, tuple]] = None):
+        """render instructions onto image. get instruction list from .compute() method on your outermost Layout object.
+        Pass the same `cache` dict to repeated renders of a cached Ilist to convert each source image only once.
+        """
+        cache = {} if cache is None else cache
         for inst in self:
-            if inst.image:
-                im.paste(inst.image, box=inst.topleft(dpi))
+            if inst and inst.image:
+                source, mask = prepare_cached(inst.image, im.mode, cache)
+                composite(im, source, mask, inst.topleft(dpi))
         return im
 
     def height(self) -> Unit:
@@ -113,6 +122,37 @@ class Ilist(list):
         logger.debug('aligning middle=%s dir=%s container=%s offset=%s', middle, direction, container, offset)
         return self.offset(offset, direction) if offset.n > 0 else self
 
+ALPHA_MODES = ('LA', 'PA', 'La', 'RGBa')
+
+def prepare(image: Image.Image, mode: str) -> Tuple[Image.Image, Optional[Image.Image]]:
+    "convert image to canvas mode. returns (image, mask); mask is None when the image is opaque and can be pasted directly"
+    if image.mode in ALPHA_MODES or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+    if image.mode == 'RGBA' and image.getextrema()[3][0] < 255:
+        # note: RGBA canvas keeps the RGBA source for alpha_composite, which is why mask can be the image itself
+        return (image, image) if mode == 'RGBA' else (image.convert(mode), image.getchannel('A'))
+    return (image if image.mode == mode else image.convert(mode)), None
+
+def prepare_cached(image: Image.Image, mode: str, cache: Dict[int, tuple]) -> Tuple[Image.Image, Optional[Image.Image]]:
+    "prepare() memoized on image identity. the original is kept in the value so its id can't be reused"
+    key = (id(image), mode)
+    if (hit := cache.get(key)) is None or hit[0] is not image:
+        hit = cache[key] = (image, *prepare(image, mode))
+    return hit[1], hit[2]
+
+def composite(im: Image.Image, source: Image.Image, mask: Optional[Image.Image], topleft: Tuple[int, int]):
+    "draw a prepare()d source onto im in place"
+    if mask is None:
+        im.paste(source, box=topleft)
+    elif im.mode == 'RGBA':
+        # alpha_composite doesn't take negative dest, so crop the source instead
+        left, top = topleft
+        if left >= im.width or top >= im.height or left + source.width <= 0 or top + source.height <= 0:
+            return # entirely off canvas
+        im.alpha_composite(source, dest=(max(left, 0), max(top, 0)), source=(max(-left, 0), max(-top, 0)))
+    else:
+        im.paste(source, box=topleft, mask=mask)
+
 def sum_dim(ilist_list: List[Ilist], direction: Direction) -> Dim:
     "sums sizes of sublists. returns a dim with only one axis, aka a directional length"
     dim = sum((ilist.dim(direction) for ilist in ilist_list if ilist), Unit.zero())
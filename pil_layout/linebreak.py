@@ -0,0 +1,57 @@
+"paragraph-aware greedy line breaking. remembers its last input so edited text only re-wraps from the first changed paragraph"
+
+import itertools, logging, threading
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+class LineBreaker:
+    "wraps text to a fixed width, given a measure function (e.g. FreeTypeFont.getlength). wrap() is thread-safe"
+
+    def __init__(self, measure: Callable[[str], float], width: float):
+        self.measure = measure
+        self.width = width
+        self.space = measure(' ')
+        self.word_widths: Dict[str, float] = {} # words repeat a lot in long text
+        self.paragraphs: List[str] = []
+        self.lines: List[List[str]] = [] # wrapped lines for each of self.paragraphs
+        self.lock = threading.Lock() # paragraphs + lines are updated together
+
+    def word_width(self, word: str) -> float:
+        if (width := self.word_widths.get(word)) is None:
+            width = self.word_widths[word] = self.measure(word)
+            if width > self.width:
+                logger.warning('word is wider than line %s %s', width, self.width)
+        return width
+
+    def break_paragraph(self, paragraph: str) -> List[str]:
+        "greedy break of a single paragraph. blank paragraphs give one empty line so they still take up space"
+        words = paragraph.split()
+        if not words:
+            return ['']
+        # starts[i] is where word i would start if everything were on one line, so a line of words a..b-1 is starts[b] - starts[a] - space wide
+        starts = list(itertools.accumulate((self.word_width(word) + self.space for word in words), initial=0))
+        lines = []
+        start = 0
+        for end in range(1, len(words)):
+            if starts[end + 1] - starts[start] - self.space > self.width:
+                lines.append(' '.join(words[start:end]))
+                start = end
+        lines.append(' '.join(words[start:]))
+        return lines
+
+    def wrap(self, text: str) -> List[str]:
+        "return wrapped lines. paragraphs are split on newlines"
+        paragraphs = text.split('\n')
+        with self.lock:
+            return self.wrap_locked(paragraphs)
+
+    def wrap_locked(self, paragraphs: List[str]) -> List[str]:
+        "body of wrap(), caller holds self.lock"
+        first_changed = next(
+            (i for i, (old, new) in enumerate(zip(self.paragraphs, paragraphs)) if old != new),
+            min(len(self.paragraphs), len(paragraphs)),
+        )
+        self.lines = self.lines[:first_changed] + [self.break_paragraph(paragraph) for paragraph in paragraphs[first_changed:]]
+        self.paragraphs = paragraphs
+        return [line for lines in self.lines for line in lines]
@@ -1,10 +1,12 @@
-import logging
-from dataclasses import dataclass
-from typing import List
+import functools, hashlib, logging
+from dataclasses import dataclass, field
+from typing import Optional
 from PIL import Image, ImageDraw, ImageFont
 from .base import Layout
 from .units import Dim, Unit
 from .instruction import Instruction, Ilist
+from .linebreak import LineBreaker
+from . import budget
 
 logger = logging.getLogger(__name__)
 
@@ -58,56 +60,72 @@ class ImageRenderable(Renderable):
 
     def compute(self, dim: Dim, dpi: int) -> Ilist:
         scaled = self.scaled_dim(self.dim(dpi), dim)
-        scaled_px = scaled.to_px(dpi)
-        return Ilist([Instruction.from_dim(scaled, self.image.resize(scaled_px.tuple()), source=self.source())])
+        size = scaled.to_px(dpi).tuple()
+        if (charged := budget.charge(size, self.image.mode, can_downsample=True)) != size:
+            # downsampled to fit the budget; the image takes up a smaller box rather than being stretched at render
+            size = charged
+            scaled = Dim.inch(*size, unit='px').to_in(dpi)
+        return Ilist([Instruction.from_dim(scaled, self.image.resize(size), source=self.source())])
 
-@dataclass
-class Line:
-    "helper for TextRenderable"
-    words: List[str]
-    total: int = 0
-
-    def add(self, width, word):
-        self.total += width
-        self.words.append(word)
+@functools.lru_cache(maxsize=64)
+def load_font(path: str, size_px: int) -> ImageFont.FreeTypeFont:
+    "truetype() parses the font file every time; cache it"
+    return ImageFont.truetype(path, size_px)
 
 @dataclass
 class TextRenderable(Renderable):
     text: str
     font: str
     size: Unit # font size, not bbox
+    # LineBreaker remembers the last text, so re-computing after an edit only re-wraps from the changed paragraph.
+    # concurrent computes are safe but thrash the breaker if they use different widths
+    breaker: Optional[LineBreaker] = field(default=None, init=False, repr=False, compare=False)
+    breaker_key: Optional[tuple] = field(default=None, init=False, repr=False, compare=False) # (font, size px, width px) breaker was made for
+
+    def __getstate__(self):
+        "leave the breaker out of pickles and deepcopies. it holds a lock and a bound font method, and is only a cache"
+        return {**self.__dict__, 'breaker': None, 'breaker_key': None}
+
+    def digest(self) -> bytes:
+        "font is a path or name, so also hash the font it points to"
+        from .digest import font_digest # pylint: disable=import-outside-toplevel
+        return hashlib.sha256(super().digest() + font_digest(self.font)).digest()
+
+    def interline(self, dpi: int) -> int:
+        return int(self.size.to_px(dpi).n / 8)
 
     def wrap(self, dim: Dim, dpi):
         "helper for compute. broken out so test suite can hit it"
-        # todo: respect existing newlines
         # todo: trace timing here
         # todo: support RTL text
-        font = ImageFont.truetype(self.font, int(self.size.to_px(dpi).n))
-        im = Image.new('RGBA', dim.to_px(dpi).tuple())
+        font = load_font(self.font, int(self.size.to_px(dpi).n))
+        size = dim.to_px(dpi).tuple()
+        key = (self.font, font.size, size[0])
+        # note: local binding, so a concurrent compute at another width can swap self.breaker without affecting this one
+        breaker = self.breaker
+        if breaker is None or self.breaker_key != key:
+            breaker = self.breaker = LineBreaker(font.getlength, size[0])
+            self.breaker_key = key
+        strlines = breaker.wrap(self.text)
+        if dim.height is None:
+            # open height: size the canvas to the text rather than 4x width, so long text isn't cut off
+            # this is PIL's multiline line pitch, plus a full ascent + descent for the last line. compute() crops to the real bbox
+            ascent, descent = font.getmetrics()
+            line_pitch = font.getbbox('A')[3] + self.interline(dpi)
+            size = (size[0], (len(strlines) - 1) * line_pitch + ascent + descent)
+        im = Image.new('RGBA', budget.charge(size, 'RGBA'))
         draw = ImageDraw.Draw(im)
-        if draw.textlength(self.text, font) > im.width:
-            # wrapping logic
-            words = self.text.split()
-            space = draw.textlength(' ', font)
-            widths = [draw.textlength(word, font) for word in words]
-            lines: List[Line] = [Line([])]
-            for word, width in zip(words, widths):
-                if width > im.width:
-                    logger.warning('word is wider than line %s %s', width, im.width)
-                if lines[-1].total + len(lines[-1].words) * space + width > im.width:
-                    lines.append(Line([]))
-                lines[-1].add(width, word)
-            strlines = [' '.join(line.words) for line in lines if line.words]
-        else:
-            strlines = [self.text]
         return font, im, draw, strlines
 
     def compute(self, dim: Dim, dpi: int) -> Ilist:
         "render text, including wrap"
         font, im, draw, strlines = self.wrap(dim, dpi)
         multiline = '\n'.join(strlines)
-        interline = int(self.size.to_px(dpi).n / 8)
+        interline = self.interline(dpi)
         draw.multiline_text((0, 0), multiline, fill='black', font=font, spacing=interline)
         box = draw.multiline_textbbox((0, 0), multiline, font, spacing=interline)
+        full_size = im.size
         im = im.crop(box)
+        budget.charge(im.size, im.mode)
+        budget.release(full_size, im.mode)
         return Ilist([Instruction.from_dim(Dim.inch(im.width, im.height, 'px').to_in(dpi), im, source=self.source())])
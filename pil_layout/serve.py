@@ -0,0 +1,214 @@
+"""long-lived render worker. keeps fonts, decoded images and computed layouts warm between requests.
+run as `python -m pil_layout.serve --socket /run/pil_layout.sock` or `--port 8123` (binds localhost).
+POST a json body like {"layout": <spec>, "dim": [8, 10], "dpi": 100, "format": "png"}; the response is the encoded image.
+"""
+
+import argparse, hashlib, json, logging, os, socketserver, threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+from PIL import Image
+from .budget import Budget, bytes_per_pixel
+from .common import LayoutError
+from .units import Dim
+from .spec import build, parse_dim
+from .digest import digest_value
+from .cache import OutputCache, MemoryCache, DirectoryCache, cache_key, encode
+
+logger = logging.getLogger(__name__)
+
+class LRU(OrderedDict):
+    "bounded dict, evicts least recently used past maxsize entries or max_weight total weight. caller holds the lock"
+
+    def __init__(self, maxsize: int, max_weight: Optional[int] = None, weight: Callable[[object], int] = lambda value: 0):
+        super().__init__()
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weight = weight
+        self.weights: Dict[object, int] = {}
+        self.total = 0
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def put(self, key, value):
+        self.discard(key)
+        weight = self.weight(value)
+        if self.max_weight is not None and weight > self.max_weight:
+            return # too big to cache at all
+        self[key] = value
+        self.weights[key] = weight
+        self.total += weight
+        while len(self) > self.maxsize or (self.max_weight is not None and self.total > self.max_weight):
+            self.discard(next(iter(self)))
+
+    def discard(self, key):
+        if key in self:
+            del self[key]
+            self.total -= self.weights.pop(key)
+
+def image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * bytes_per_pixel(image.mode)
+
+class Worker:
+    "render requests against warm caches. thread-safe; identical concurrent requests are computed once"
+
+    def __init__(
+        self,
+        max_images: int = 256,
+        max_layouts: int = 256,
+        output: Optional[OutputCache] = None,
+        max_bytes: Optional[int] = 1 << 30,
+        max_image_bytes: Optional[int] = 256 << 20,
+        max_layout_bytes: Optional[int] = 512 << 20,
+    ):
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes # image memory per request, see Budget
+        self.output = output # encoded results by cache_key()
+        # the warm caches are bounded by decoded image bytes as well as entry count
+        self.images: LRU = LRU(max_images, max_image_bytes, lambda hit: image_bytes(hit[1])) # path -> (mtime, decoded image)
+        self.layouts: LRU = LRU( # (layout digest, dim, dpi) -> computed Ilist
+            max_layouts,
+            max_layout_bytes,
+            lambda ilist: sum(image_bytes(inst.image) for inst in ilist if inst and inst.image),
+        )
+        self.prepared: Dict[int, tuple] = {} # Ilist.render cache of mode-converted images
+        self.max_prepared = max_images * 4
+        self.inflight: Dict[bytes, Future] = {}
+
+    def load_image(self, path: str) -> Image.Image:
+        "decode once per file version"
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            hit = self.images.get(path)
+        if hit and hit[0] == mtime:
+            return hit[1]
+        image = Image.open(path)
+        image.load()
+        with self.lock:
+            self.images.put(path, (mtime, image))
+        return image
+
+    def render(self, request: dict) -> bytes:
+        "render a decoded request to encoded image bytes"
+        if not isinstance(request, dict):
+            raise LayoutError(f"request must be an object, got {type(request).__name__}")
+        dpi = request.get('dpi', 100)
+        if not isinstance(dpi, int) or isinstance(dpi, bool) or dpi <= 0:
+            raise LayoutError(f"dpi must be a positive integer, got {dpi!r}")
+        dim = parse_dim(request['dim'])
+        # the built-in layouts work in inches, and mixing units trips the asserts in Unit
+        dim = Dim(dim.width and dim.width.to_in(dpi), dim.height and dim.height.to_in(dpi))
+        params = (request.get('format', 'png'), request.get('mode', 'RGBA'), request.get('background'))
+        # note: building is cheap with warm images, and the digest covers image content, so edited files aren't served stale
+        layout = build(request['layout'], self.load_image, dpi)
+        key = cache_key(layout, dim, dpi, *params)
+        if self.output is not None and (data := self.output.get(key)) is not None:
+            return data
+        # requests are untrusted, so a huge dim or dpi raises LayoutError instead of allocating gigabytes
+        with Budget(max_bytes=self.max_bytes):
+            layout_key = (layout.digest(), digest_value(dim), dpi)
+            with self.lock:
+                ilist = self.layouts.get(layout_key)
+            if ilist is None:
+                ilist = layout.compute(dim, dpi)
+                with self.lock:
+                    self.layouts.put(layout_key, ilist)
+            if len(self.prepared) > self.max_prepared:
+                # entries pin their source images, so don't let this grow past the layout cache
+                self.prepared.clear()
+            data = encode(ilist, dim, dpi, *params, prepared=self.prepared)
+        if self.output is not None:
+            self.output.put(key, data)
+        return data
+
+    def handle(self, body: bytes) -> bytes:
+        "render a json request body. requests with the same body that arrive while one is rendering share its result"
+        key = hashlib.sha256(body).digest()
+        with self.lock:
+            future = self.inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self.inflight[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(self.render(json.loads(body)))
+        except BaseException as err:
+            future.set_exception(err)
+        finally:
+            with self.lock:
+                del self.inflight[key]
+        return future.result()
+
+# AssertionError is what Unit raises on mixed units
+ERRORS = (LayoutError, KeyError, ValueError, TypeError, OSError, AssertionError)
+
+class Handler(BaseHTTPRequestHandler):
+    worker: Worker # set by make_server
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            data = self.worker.handle(body)
+        except ERRORS as err:
+            logger.warning('bad request: %r', err)
+            self.send_error(400, explain=repr(err))
+            return
+        except Exception as err: # pylint: disable=broad-except
+            logger.exception('render failed')
+            self.send_error(500, explain=repr(err))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # client_address is '' on unix sockets
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        logger.debug('%s %s', self.address_string(), format % args)
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def make_server(worker: Worker, socket_path: Optional[str] = None, port: int = 8123):
+    handler = type('BoundHandler', (Handler,), {'worker': worker})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        return UnixHTTPServer(socket_path, handler)
+    return ThreadingHTTPServer(('127.0.0.1', port), handler)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--socket', help="unix socket path. if omitted, serve http on localhost")
+    parser.add_argument('--port', type=int, default=8123)
+    parser.add_argument('--max-images', type=int, default=256)
+    parser.add_argument('--max-layouts', type=int, default=256)
+    parser.add_argument('--max-bytes', type=int, default=1 << 30, help="image memory limit per request. concurrent requests each get this much")
+    parser.add_argument('--max-image-bytes', type=int, default=256 << 20, help="memory limit for decoded source images kept warm")
+    parser.add_argument('--max-layout-bytes', type=int, default=512 << 20, help="memory limit for computed layouts kept warm")
+    parser.add_argument('--cache-dir', help="keep encoded output in this directory. default is an in-memory cache")
+    parser.add_argument('--cache-bytes', type=int, default=256 << 20, help="size limit for the output cache")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    output = DirectoryCache(args.cache_dir, args.cache_bytes) if args.cache_dir else MemoryCache(args.cache_bytes)
+    server = make_server(Worker(args.max_images, args.max_layouts, output, args.max_bytes, args.max_image_bytes, args.max_layout_bytes), args.socket, args.port)
+    logger.info('serving on %s', args.socket or f'127.0.0.1:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
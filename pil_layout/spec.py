@@ -0,0 +1,56 @@
+"build a Layout tree from a json-able spec, like {'type': 'Axis', 'direction': 'horz', 'children': [...]}"
+# units are [n, 'in' | 'px'] or a bare number, which means inches. px are converted to inches when build() gets a dpi
+
+from typing import Callable, Dict, Optional
+from PIL import Image
+from .base import Layout
+from .common import LayoutError
+from .units import Dim, Unit
+from .renderable import Box, ImageRenderable, TextRenderable
+from .axis import Axis, Flex
+from .transform import AspectRatio, Padding
+
+TYPES = {cls.__name__: cls for cls in (Box, ImageRenderable, TextRenderable, Axis, Flex, AspectRatio, Padding)}
+UNIT_FIELDS = ('width', 'height', 'size', 'pad')
+
+def parse_unit(value) -> Unit:
+    if isinstance(value, (int, float)):
+        return Unit.inch(value)
+    n, unit = value
+    if unit not in ('in', 'px'):
+        raise LayoutError(f"unknown unit {unit!r}")
+    return Unit(n, unit)
+
+def parse_dim(value) -> Dim:
+    "[width, height], either may be null"
+    width, height = value
+    return Dim(None if width is None else parse_unit(width), None if height is None else parse_unit(height))
+
+def build(spec: dict, load_image: Callable[[str], Image.Image] = Image.open, dpi: Optional[int] = None, path: Optional[list] = None) -> Layout:
+    """construct the tree. ImageRenderable takes {'path': ...}, which is passed to load_image so callers can cache decoding.
+    Pass the dpi you'll compute at to convert px fields to inches; the built-in layouts can't mix units.
+    """
+    if not isinstance(spec, dict):
+        raise LayoutError(f"layout spec must be an object, got {type(spec).__name__}", path=path)
+    path = (path or []) + [spec.get('type', '?')]
+    if (cls := TYPES.get(spec.get('type'))) is None:
+        raise LayoutError(f"unknown layout type {spec.get('type')!r}", path=path)
+    kwargs: Dict[str, object] = {}
+    try:
+        for key, value in spec.items():
+            if key == 'type':
+                continue
+            elif key == 'children':
+                value = [build(child, load_image, dpi, path) for child in value]
+            elif key == 'child':
+                value = build(value, load_image, dpi, path)
+            elif key in UNIT_FIELDS:
+                value = parse_unit(value)
+                if dpi is not None:
+                    value = value.to_in(dpi)
+            elif cls is ImageRenderable and key == 'path':
+                key, value = 'image', load_image(value)
+            kwargs[key] = value
+        return cls(**kwargs)
+    except (TypeError, ValueError, OSError) as err:
+        raise LayoutError(f"bad spec: {err}", path=path) from err
@@ -0,0 +1,36 @@
+import pytest
+from PIL import Image
+from pil_layout import Axis, Box, Budget, Dim, ImageRenderable
+from pil_layout.common import LayoutError
+from . import base
+
+def test_budget_accounting():
+    layout = Axis('horz', [ImageRenderable(Image.new('RGB', (10, 10))), Box.inch(1, is_spacer=False)])
+    with Budget(per_node=True) as budget:
+        layout.compute(Dim.inch(2, 1), dpi=10)
+    assert budget.peak_bytes == 10 * 10 * 4
+    assert budget.total_pixels == 100
+    assert dict(budget.by_node) == {'Axis/ImageRenderable': 400}
+
+def test_budget_ceiling():
+    layout = Axis('horz', [ImageRenderable(Image.new('L', (10, 10)))])
+    with pytest.raises(LayoutError) as err, Budget(max_bytes=1000):
+        layout.compute(Dim.inch(100, 100), dpi=10)
+    assert err.value.path == ['Axis', 'ImageRenderable']
+
+    with Budget(max_bytes=1000, allow_downsample=True) as budget:
+        inst, = layout.compute(Dim.inch(100, 100), dpi=10)
+    assert inst.image.size == (31, 31)
+    assert inst.box(10) == (0, 0, 31, 31)
+    assert budget.peak_bytes <= 1000
+    # per-node accounting is opt-in
+    assert not budget.by_node
+
+def test_budget_shrink():
+    "Axis shrinking its children releases the pre-shrink images"
+    layout = Axis('horz', [ImageRenderable(Image.new('L', (10, 10)))] * 2)
+    with Budget(max_bytes=220) as budget:
+        ilist = layout.compute(Dim.inch(1, 1), dpi=10)
+    assert sum(inst.image.width * inst.image.height for inst in ilist) == 50
+    assert budget.live_bytes == 50
+    assert budget.peak_bytes == 200
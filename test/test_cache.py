@@ -0,0 +1,74 @@
+import os
+from PIL import Image
+from pil_layout import Axis, Box, Dim, ImageRenderable, Padding, TextRenderable, Unit
+from pil_layout.cache import MemoryCache, DirectoryCache, cache_key, render_cached
+from . import base
+
+def tree(color='red'):
+    return Padding(Axis('horz', [ImageRenderable(Image.new('RGB', (10, 10), color)), Box.inch(1)]), Unit.inch(0.1))
+
+def test_digest():
+    assert tree().digest() == tree().digest()
+    assert tree().digest() != tree('blue').digest()
+    assert tree().digest() != Padding(tree().child, Unit.inch(0.2)).digest()
+    # int vs float params are different trees
+    assert Box.inch(1).digest() != Box.inch(1.0).digest()
+    args = (Dim.inch(2, 1), 10, 'png')
+    assert cache_key(tree(), *args) == cache_key(tree(), *args)
+    assert cache_key(tree(), *args) != cache_key(tree(), Dim.inch(2, 1), 20, 'png')
+
+def test_memory_cache():
+    cache = MemoryCache(max_bytes=10)
+    cache.put(b'a', b'12345')
+    cache.put(b'b', b'12345')
+    assert cache.get(b'a') == b'12345'
+    cache.put(b'c', b'12345')
+    # b was least recently used
+    assert cache.get(b'b') is None
+    assert cache.get(b'a') == cache.get(b'c') == b'12345'
+
+def test_render_cached(tmp_path):
+    cache = DirectoryCache(str(tmp_path), max_bytes=1 << 20)
+    layout = tree()
+    data = render_cached(layout, Dim.inch(2, 1), 10, 'png', cache)
+    assert len(os.listdir(tmp_path)) == 1
+    layout.compute = None # a hit must not compute
+    assert render_cached(layout, Dim.inch(2, 1), 10, 'png', cache) == data
+    assert Image.open(tmp_path / os.listdir(tmp_path)[0]).size == (20, 10)
+
+def test_directory_eviction(tmp_path):
+    cache = DirectoryCache(str(tmp_path), max_bytes=10)
+    for i in range(3):
+        cache.put(bytes([i]), b'1234')
+        os.utime(tmp_path / bytes([i]).hex(), ns=(i, i))
+    assert cache.get(b'\0') is None
+    assert cache.get(b'\2') == b'1234'
+
+def test_digest_palette():
+    p_red, p_blue = Image.new('P', (2, 2), 0), Image.new('P', (2, 2), 0)
+    p_red.putpalette([255, 0, 0])
+    p_blue.putpalette([0, 0, 255])
+    assert ImageRenderable(p_red).digest() != ImageRenderable(p_blue).digest()
+    p_clear = p_red.copy()
+    p_clear.info['transparency'] = 0
+    assert ImageRenderable(p_red).digest() != ImageRenderable(p_clear).digest()
+
+def test_eviction_skips_temp_files(tmp_path):
+    (tmp_path / '.tmp-inflight').write_bytes(b'x' * 100)
+    os.utime(tmp_path / '.tmp-inflight', ns=(0, 0))
+    cache = DirectoryCache(str(tmp_path), max_bytes=10)
+    assert cache.total == 0
+    for i in range(3):
+        cache.put(bytes([i]), b'1234')
+    assert (tmp_path / '.tmp-inflight').exists()
+
+def test_font_digest(tmp_path):
+    # fonts given by name (resolved by truetype() from the system font dirs) don't have to exist as a path
+    assert TextRenderable('hi', 'NoSuchFont.ttf', Unit.inch(1)).digest() != TextRenderable('hi', 'OtherFont.ttf', Unit.inch(1)).digest()
+    # font files are hashed by content
+    path = tmp_path / 'font.ttf'
+    path.write_bytes(b'version 1')
+    before = TextRenderable('hi', str(path), Unit.inch(1)).digest()
+    path.write_bytes(b'version 2')
+    os.utime(path, ns=(1, 1))
+    assert TextRenderable('hi', str(path), Unit.inch(1)).digest() != before
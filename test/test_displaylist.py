@@ -0,0 +1,50 @@
+import pytest
+from PIL import Image
+from pil_layout import Axis, Box, Dim, Ilist, ImageRenderable, Instruction, BlobStore
+from pil_layout import displaylist
+from pil_layout.common import LayoutError
+from . import base
+
+def test_roundtrip(tmp_path):
+    store = BlobStore(str(tmp_path / 'blobs'))
+    red = Image.new('RGBA', (20, 10), 'red')
+    layout = Axis('horz', [ImageRenderable(red), Box.inch(1, is_spacer=False), ImageRenderable(red)])
+    ilist = layout.compute(Dim.inch(4, 1), dpi=10)
+    path = str(tmp_path / 'layout.pldl')
+    displaylist.dump(ilist, path, store)
+
+    # fresh store so images come from disk, not the in-process cache
+    loaded = displaylist.load(path, BlobStore(str(tmp_path / 'blobs')))
+    assert [inst.box(10) for inst in loaded] == [inst.box(10) for inst in ilist]
+    assert [inst.image and inst.image.tobytes() for inst in loaded] == [inst.image and inst.image.tobytes() for inst in ilist]
+    # both images have the same content so only one blob is stored
+    assert len(list((tmp_path / 'blobs').iterdir())) == 1
+    canvas = loaded.render(Image.new('RGBA', (40, 10)), 10)
+    assert canvas.getpixel((0, 0)) == (255, 0, 0, 255)
+
+def test_null_and_units():
+    ilist = Ilist([Instruction.tlbr(0, 0.5, 1, 2, unit='px'), None, Instruction.from_dim(Dim.inch(1, 1))])
+    loaded = displaylist.loads(displaylist.dumps(ilist, None), None)
+    assert loaded == ilist
+
+def test_palette(tmp_path):
+    store = BlobStore(str(tmp_path))
+    red = Image.new('P', (2, 2), 0)
+    red.putpalette([255, 0, 0])
+    ilist = Ilist([Instruction.from_dim(Dim.inch(2, 2, 'px'), image=red)])
+    loaded = displaylist.loads(displaylist.dumps(ilist, store), BlobStore(str(tmp_path)))
+    assert loaded[0].image.convert('RGB').getpixel((0, 0)) == (255, 0, 0)
+
+def test_loaded_bound(tmp_path):
+    store = BlobStore(str(tmp_path), max_loaded=2)
+    digests = [store.put(Image.new('L', (1, 1), i)) for i in range(5)]
+    assert len(store.loaded) == 2
+    store = BlobStore(str(tmp_path), max_loaded=2)
+    assert [store.get(digest).getpixel((0, 0)) for digest in digests] == list(range(5))
+    assert list(store.loaded) == digests[-2:]
+
+def test_corrupt():
+    data = displaylist.dumps(Ilist([Instruction.from_dim(Dim.inch(1, 1))]), None)
+    for bad in (data[:5], data[:-1], data + b'\0', b'XXXX' + data[4:]):
+        with pytest.raises(LayoutError):
+            displaylist.loads(bad, None)
@@ -1,4 +1,5 @@
 import pytest
+from PIL import Image
 from pil_layout import Instruction, Unit, Dim, Ilist
 from pil_layout.instruction import sum_dim
 from . import base
@@ -18,3 +19,30 @@ def test_ilist_wh():
 @pytest.mark.skip
 def test_align():
     raise NotImplementedError
+
+def test_render_alpha():
+    im = Image.new('RGBA', (4, 2), 'red')
+    half = Image.new('RGBA', (2, 2), (0, 0, 255, 0))
+    half.putpixel((0, 0), (0, 0, 255, 255))
+    ilist = Ilist([Instruction(Unit.zero(), Unit.inch(-1, 'px'), Unit.inch(2, 'px'), Unit.inch(1, 'px'), image=half)])
+    # transparent pixels don't clobber background; negative offset is cropped
+    ilist.render(im, 1)
+    assert [im.getpixel((x, 0)) for x in range(2)] == [(255, 0, 0, 255)] * 2
+    ilist = ilist.offset(Unit.inch(2, 'px'), 'horz')
+    ilist.render(im, 1)
+    assert [im.getpixel((x, 0)) for x in range(1, 3)] == [(0, 0, 255, 255), (255, 0, 0, 255)]
+    # entirely off canvas on every side, and overhanging the bottom right
+    before = im.tobytes()
+    for offset, direction in [(-4, 'horz'), (-4, 'vert'), (4, 'horz'), (4, 'vert')]:
+        ilist.offset(Unit.inch(offset, 'px'), direction).render(im, 1)
+    assert im.tobytes() == before
+    ilist.offset(Unit.inch(1, 'px'), 'horz').offset(Unit.inch(1, 'px'), 'vert').render(im, 1)
+    assert im.getpixel((2, 1)) == (0, 0, 255, 255)
+
+    # non-RGBA canvas and mixed-mode sources
+    cache = {}
+    rgb = Ilist([Instruction.from_dim(Dim.inch(2, 2, 'px'), image=half), Instruction.from_dim(Dim.inch(1, 1, 'px'), image=Image.new('L', (1, 1), 255))])
+    im = rgb.render(Image.new('RGB', (2, 2), 'red'), 1, cache)
+    assert im.getpixel((0, 0)) == (255, 255, 255)
+    assert im.getpixel((1, 1)) == (255, 0, 0)
+    assert len(cache) == 2
@@ -0,0 +1,48 @@
+import threading
+from pil_layout.linebreak import LineBreaker
+from . import base
+
+class CountingMeasure:
+    "1 unit per character, counts calls"
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return len(text)
+
+def test_paragraphs():
+    breaker = LineBreaker(len, 10)
+    assert breaker.wrap('aaa bbb ccc ddd') == ['aaa bbb', 'ccc ddd']
+    assert breaker.wrap('aaa\n\nbbb ccc  ddd eeeeeeeeeeee f') == ['aaa', '', 'bbb ccc', 'ddd', 'eeeeeeeeeeee', 'f']
+    # exact fit
+    assert breaker.wrap('aaaa bbbbb') == ['aaaa bbbbb']
+
+def test_incremental():
+    measure = CountingMeasure()
+    breaker = LineBreaker(measure, 10)
+    text = '\n'.join(f'word{i} other{i}' for i in range(100))
+    lines = breaker.wrap(text)
+    assert len(lines) == 200
+    calls = measure.calls
+    breaker.break_paragraph = None # unchanged text must not re-break anything
+    assert breaker.wrap(text) == lines
+    del breaker.break_paragraph
+    assert breaker.wrap(text + ' appended') == lines + ['appended']
+    # only the new word got measured
+    assert measure.calls == calls + 1
+
+def test_threads():
+    breaker = LineBreaker(len, 10)
+    texts = ['aaa bbb ccc ddd\neee', 'aaa bbb\nccc ddd eee fff', 'x y z']
+    expected = {text: LineBreaker(len, 10).wrap(text) for text in texts}
+    results = []
+    def worker(text):
+        for _ in range(200):
+            results.append(breaker.wrap(text) == expected[text])
+    threads = [threading.Thread(target=worker, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(results)
@@ -1,5 +1,7 @@
+import copy, pickle
 import pytest
 from pil_layout import TextRenderable, Unit, Dim
+from pil_layout.linebreak import LineBreaker
 from . import base
 
 @pytest.mark.noci
@@ -15,3 +17,19 @@ def test_text_wrap():
     assert (round(inst.image.width / 10), round(inst.image.height / 10)) == (156, 52)
     # toggle this on to inspect ye image
     # inst.image.save(open('tmp.png', 'wb'), 'png')
+
+def test_text_cache_fields():
+    "breaker is a cache, not a parameter"
+    with pytest.raises(TypeError):
+        TextRenderable('text', 'font.ttf', Unit.inch(1), None)
+    assert TextRenderable('text', 'font.ttf', Unit.inch(1)) == TextRenderable('text', 'font.ttf', Unit.inch(1))
+
+def test_text_pickle():
+    "the breaker cache holds a lock, which can't be pickled or copied"
+    textr = TextRenderable('text', 'font.ttf', Unit.inch(1))
+    textr.breaker, textr.breaker_key = LineBreaker(len, 10), ('font.ttf', 10, 10)
+    for clone in (pickle.loads(pickle.dumps(textr)), copy.deepcopy(textr), copy.copy(textr)):
+        assert clone == textr
+        assert clone.breaker is None and clone.breaker_key is None
+    # the original keeps its cache
+    assert textr.breaker is not None
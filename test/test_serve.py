@@ -0,0 +1,114 @@
+import http.client, io, json, os, threading
+import pytest
+from PIL import Image
+from pil_layout import spec
+from pil_layout.serve import LRU, Worker, make_server
+from pil_layout.common import LayoutError
+from pil_layout import Axis, Box, ImageRenderable, Padding, Unit
+from . import base
+
+def write_image(tmp_path):
+    path = str(tmp_path / 'red.png')
+    Image.new('RGB', (10, 10), 'red').save(path)
+    return path
+
+def test_build(tmp_path):
+    path = write_image(tmp_path)
+    layout = spec.build({'type': 'Padding', 'pad': [1, 'px'], 'child': {
+        'type': 'Axis', 'direction': 'horz', 'children': [{'type': 'ImageRenderable', 'path': path}, {'type': 'Box', 'width': 1, 'height': 1}],
+    }})
+    assert isinstance(layout, Padding) and layout.pad == Unit(1, 'px')
+    assert isinstance(layout.child, Axis)
+    assert isinstance(layout.child.children[0], ImageRenderable)
+    assert layout.child.children[1] == Box.inch(1)
+
+def test_worker(tmp_path):
+    path = write_image(tmp_path)
+    worker = Worker()
+    body = json.dumps({'layout': {'type': 'ImageRenderable', 'path': path}, 'dim': [[20, 'px'], [20, 'px']], 'dpi': 10, 'format': 'png'}).encode()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(worker.handle(body))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1
+    assert len(worker.layouts) == 1 and len(worker.images) == 1
+    im = Image.open(io.BytesIO(results[0]))
+    assert im.size == (20, 20)
+    assert im.getpixel((0, 0)) == (255, 0, 0, 255)
+
+def test_worker_edited_image(tmp_path):
+    path = write_image(tmp_path)
+    worker = Worker()
+    body = json.dumps({'layout': {'type': 'ImageRenderable', 'path': path}, 'dim': [1, 1], 'dpi': 10}).encode()
+    assert Image.open(io.BytesIO(worker.handle(body))).getpixel((0, 0)) == (255, 0, 0, 255)
+    Image.new('RGB', (10, 10), 'blue').save(path)
+    os.utime(path, ns=(1, 1)) # make sure mtime changes even on coarse filesystems
+    assert Image.open(io.BytesIO(worker.handle(body))).getpixel((0, 0)) == (0, 0, 255, 255)
+
+def test_worker_px_fields(tmp_path):
+    path = write_image(tmp_path)
+    layout = {'type': 'Padding', 'pad': [2, 'px'], 'child': {
+        'type': 'Axis', 'direction': 'horz', 'children': [{'type': 'ImageRenderable', 'path': path}, {'type': 'Box', 'width': [5, 'px'], 'height': [5, 'px']}],
+    }}
+    body = json.dumps({'layout': layout, 'dim': [[30, 'px'], [14, 'px']], 'dpi': 10}).encode()
+    im = Image.open(io.BytesIO(Worker().handle(body)))
+    assert im.size == (30, 14)
+    assert im.getpixel((1, 1)) == (0, 0, 0, 0)
+    assert im.getpixel((2, 2)) == (255, 0, 0, 255)
+
+def test_worker_budget(tmp_path):
+    path = write_image(tmp_path)
+    body = json.dumps({'layout': {'type': 'ImageRenderable', 'path': path}, 'dim': [1000, 1000], 'dpi': 1000}).encode()
+    with pytest.raises(LayoutError):
+        Worker(max_bytes=1 << 20).handle(body)
+    # the canvas is charged too
+    body = json.dumps({'layout': {'type': 'Box', 'width': 1, 'height': 1}, 'dim': [1000, 1000], 'dpi': 1000}).encode()
+    with pytest.raises(LayoutError):
+        Worker(max_bytes=1 << 20).handle(body)
+
+def test_worker_bad_requests():
+    worker = Worker()
+    for body in [[], {'layout': 'x', 'dim': [1, 1]}, {'layout': {'type': 'Box', 'width': 1, 'height': 1}, 'dim': [[5, 'px'], 1], 'dpi': 0}]:
+        with pytest.raises(LayoutError):
+            worker.handle(json.dumps(body).encode())
+
+def test_http_errors():
+    worker = Worker()
+    server = make_server(worker, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        def post(body):
+            conn = http.client.HTTPConnection(*server.server_address)
+            conn.request('POST', '/', body)
+            return conn.getresponse().status
+        assert post(b'[]') == 400
+        def broken(request):
+            raise RuntimeError('bug')
+        worker.render = broken # unexpected errors are a 500, not a dropped connection
+        assert post(b'{}') == 500
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_lru_weight():
+    lru = LRU(10, max_weight=10, weight=len)
+    lru.put('a', 'x' * 4)
+    lru.put('b', 'x' * 4)
+    lru.get('a')
+    lru.put('c', 'x' * 4)
+    # b was least recently used
+    assert list(lru) == ['a', 'c'] and lru.total == 8
+    lru.put('d', 'x' * 11)
+    assert 'd' not in lru and lru.total == 8
+
+def test_worker_cache_bytes(tmp_path):
+    path = write_image(tmp_path)
+    worker = Worker(max_layout_bytes=30 * 30 * 4)
+    for dpi in (10, 20, 30):
+        worker.handle(json.dumps({'layout': {'type': 'ImageRenderable', 'path': path}, 'dim': [1, 1], 'dpi': dpi}).encode())
+    # 10x10 + 20x20 fit together, then the 30x30 layout pushes both out
+    assert len(worker.layouts) == 1
+    assert worker.layouts.total == 30 * 30 * 4
+    assert worker.images.total == 10 * 10 * 4